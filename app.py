@@ -17,41 +17,173 @@ Note: This is a demo. For production, you must:
 - Add input validation, rate-limiting, and secure file handling
 """
 
+import hashlib
+import hmac
+import json
+import mimetypes
 import os
-from datetime import datetime
+import secrets
+import sqlite3
+import string
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from enum import Enum
+from urllib.parse import quote, urlencode
 
 from flask import (
-    Flask, render_template, redirect, url_for, request, flash, jsonify, send_from_directory
+    Flask, render_template, redirect, url_for, request, flash, send_from_directory, session, abort
 )
+from flask.json.provider import JSONProvider
+import msgspec
+import orjson
+import redis
+from flask_caching import Cache
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from flask_session import Session
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event, func, select, text, tuple_, union
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.orm import (
+    joinedload, lazyload, load_only, make_transient_to_detached, object_session, raiseload, with_expression
+)
 from flask_login import (
     LoginManager, UserMixin, current_user, login_user, login_required, logout_user
 )
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import safe_join
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SelectField, TextAreaField, FloatField
-from wtforms.validators import InputRequired, Length, Email
+from wtforms.csrf.core import CSRF
+from wtforms.validators import InputRequired, Length, Email, ValidationError
 from passlib.hash import bcrypt
 
 # --- Configuration ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "camelcare.db")
+REDIS_URL = os.environ.get("REDIS_URL")
+
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson; keys sorted like Flask's default provider."""
+    option = orjson.OPT_NAIVE_UTC | orjson.OPT_SORT_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        # orjson has no object_hook, which the session cookie serializer needs
+        # to restore tagged values (tuples, Markup, datetimes)
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=self.option), mimetype="application/json")
+
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config["SECRET_KEY"] = os.environ.get("CAMELCARE_SECRET", "dev-secret-key")
 app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DB_PATH}"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# Pooled connections shared across threads; readers run alongside the writer
+# thanks to WAL (see set_sqlite_pragmas), and writers wait up to 30s for the lock
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    "pool_size": 10,
+    "max_overflow": 20,
+    "connect_args": {"check_same_thread": False, "timeout": 30},
+}
+app.config["BCRYPT_ROUNDS"] = int(os.environ.get("CAMELCARE_BCRYPT_ROUNDS", 12))
+# Max concurrent bcrypt computations under sync/threaded workers; extra
+# logins/registrations queue for a slot
+app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("CAMELCARE_PASSWORD_HASH_WORKERS", 4))
+app.config["LOGIN_RATE_LIMIT"] = os.environ.get("CAMELCARE_LOGIN_RATE_LIMIT", "5/minute")
+# BM25 column weights for listing search: (title, description)
+app.config["SEARCH_BM25_WEIGHTS"] = (3.0, 2.0)
+# Response cache: Redis when REDIS_URL is set, in-process otherwise (local demo)
+if REDIS_URL:
+    app.config["CACHE_TYPE"] = "RedisCache"
+    app.config["CACHE_REDIS_URL"] = REDIS_URL
+else:
+    app.config["CACHE_TYPE"] = "SimpleCache"
+app.config["CACHE_KEY_PREFIX"] = "camelcare:"
+app.config["CACHE_DEFAULT_TIMEOUT"] = 60
+# Server-side sessions in Redis when available; signed cookies otherwise
+if REDIS_URL:
+    app.config["SESSION_TYPE"] = "redis"
+    app.config["SESSION_REDIS"] = redis.from_url(REDIS_URL)
+    app.config["SESSION_KEY_PREFIX"] = "camelcare:session:"
 app.config['UPLOAD_FOLDER'] = os.path.join(BASE_DIR, "uploads")
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Let the front-end web server send upload bytes instead of Python:
+# - Apache/lighttpd: CAMELCARE_USE_X_SENDFILE=1 (Flask emits X-Sendfile)
+# - nginx: CAMELCARE_UPLOADS_ACCEL_PREFIX=/_protected/ together with
+#   location /_protected/ { internal; alias /path/to/uploads/; }
+app.config["USE_X_SENDFILE"] = os.environ.get("CAMELCARE_USE_X_SENDFILE") == "1"
+app.config["UPLOADS_ACCEL_PREFIX"] = os.environ.get("CAMELCARE_UPLOADS_ACCEL_PREFIX")
+app.config["UPLOADS_MAX_AGE"] = 24 * 3600
 
 db = SQLAlchemy(app)
+cache = Cache(app)
+if REDIS_URL:
+    Session(app)
+password_executor = ThreadPoolExecutor(
+    max_workers=app.config["PASSWORD_HASH_WORKERS"], thread_name_prefix="bcrypt"
+)
+limiter = Limiter(get_remote_address, app=app, storage_uri=REDIS_URL or "memory://")
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = "login"
 
 
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL + synchronous=NORMAL: one fsync per checkpoint instead of two per commit.
+
+    temp_store=MEMORY keeps sorter/temp b-trees off disk, mmap_size serves hot
+    pages without read() syscalls and cache_size gives each connection 64 MB.
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.close()
+
+
 # --- Models ---
+class utcnow(FunctionElement):
+    """Database-side "now" for created_at columns.
+
+    CURRENT_TIMESTAMP on most databases. On SQLite it renders the same text
+    layout SQLAlchemy uses for DateTime (with microseconds), so server-filled
+    values sort and compare correctly against bound datetimes (e.g. the
+    /api/listings cursor); SQLite's CURRENT_TIMESTAMP has no fraction.
+    Models keep a Python-side default as well, since tables created before
+    this server default have no DEFAULT clause on created_at.
+    """
+    type = db.DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def _utcnow_default(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(utcnow, "sqlite")
+def _utcnow_sqlite(element, compiler, **kw):
+    return "(strftime('%Y-%m-%d %H:%M:%f', 'now') || '000')"
+
+
 class RoleEnum(str, Enum):
     FARMER = "farmer"
     PRODUCER = "producer"
@@ -62,6 +194,32 @@ class RoleEnum(str, Enum):
     ENTREPRENEUR = "entrepreneur"
     GOV = "gov"
 
+    def __str__(self):
+        return self.value
+
+
+PASSWORD_OK_CACHE_TIMEOUT = 300
+
+
+def run_password_hashing(fn, *args):
+    """Run a bcrypt call off the event loop if there is one, and wait for the result.
+
+    Under gevent/eventlet monkey-patching, ``threading`` is green, so our own
+    executor would run bcrypt on the hub's OS thread and stall every request.
+    There the call goes to the server's native OS-thread pool instead, and only
+    the calling greenlet waits. Under sync/threaded workers the request thread
+    still blocks; the dedicated pool merely caps how many hashes run at once.
+    """
+    gevent_monkey = sys.modules.get("gevent.monkey")
+    if gevent_monkey is not None and gevent_monkey.is_module_patched("threading"):
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args)
+    eventlet_patcher = sys.modules.get("eventlet.patcher")
+    if eventlet_patcher is not None and eventlet_patcher.is_monkey_patched("thread"):
+        from eventlet import tpool
+        return tpool.execute(fn, *args)
+    return password_executor.submit(fn, *args).result()
+
 
 class User(UserMixin, db.Model):
     __tablename__ = "users"
@@ -69,18 +227,48 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(200), unique=True, nullable=False)
     password_hash = db.Column(db.String(300), nullable=False)
-    role = db.Column(db.String(50), nullable=False, default=RoleEnum.FARMER.value)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    profile = db.relationship("Profile", backref="user", uselist=False, cascade="all, delete-orphan")
+    # Stored as the plain value ("farmer", ...) so existing rows load unchanged;
+    # the attribute comes back as a RoleEnum member.
+    role = db.Column(
+        db.Enum(RoleEnum, native_enum=False, length=16, values_callable=lambda e: [m.value for m in e]),
+        nullable=False, default=RoleEnum.FARMER,
+    )
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=utcnow(), nullable=False)
+    # Loading strategies are declared per direction; the app only ever reads
+    # these collections from the other side, so they stay lazy (or raise).
+    profile = db.relationship("Profile", back_populates="user", uselist=False, lazy="joined",
+                              cascade="all, delete-orphan")
+    listings = db.relationship("Listing", back_populates="owner", lazy="raise")
+    sent_messages = db.relationship("Message", foreign_keys="Message.sender_id", back_populates="sender",
+                                    lazy="select")
+    received_messages = db.relationship("Message", foreign_keys="Message.receiver_id", back_populates="receiver",
+                                        lazy="select")
+    organized_events = db.relationship("Event", back_populates="organizer", lazy="select")
 
     def set_password(self, password):
-        self.password_hash = bcrypt.hash(password)
+        hasher = bcrypt.using(rounds=app.config["BCRYPT_ROUNDS"])
+        self.password_hash = run_password_hashing(hasher.hash, password)
+        if self.id is not None:
+            forget_cached_user(self.id)
 
     def check_password(self, password):
-        return bcrypt.verify(password, self.password_hash)
+        # Successful verifications are remembered briefly so repeat checks skip
+        # bcrypt. The key is an HMAC under SECRET_KEY, so cache contents alone
+        # cannot be used to brute-force passwords; failures are never cached.
+        key = "pwok:" + hmac.new(
+            app.config["SECRET_KEY"].encode(),
+            f"{self.id}:{self.password_hash}:{password}".encode(),
+            hashlib.sha256,
+        ).hexdigest()
+        if cache.get(key):
+            return True
+        if run_password_hashing(bcrypt.verify, password, self.password_hash):
+            cache.set(key, 1, timeout=PASSWORD_OK_CACHE_TIMEOUT)
+            return True
+        return False
 
     def get_role(self):
-        return RoleEnum(self.role)
+        return self.role
 
 
 class Profile(db.Model):
@@ -92,12 +280,19 @@ class Profile(db.Model):
     location = db.Column(db.String(200))
     bio = db.Column(db.Text)
 
+    user = db.relationship("User", back_populates="profile")
+
 
 class Listing(db.Model):
     """
     Generic listing used for milk/product offers, transport offers, vet services, etc.
     """
     __tablename__ = "listings"
+    __table_args__ = (
+        db.Index("ix_listing_created", "created_at"),
+        db.Index("ix_listing_cat_created", "category", "created_at"),
+        db.Index("ix_listing_owner_created", "owner_id", "created_at"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
@@ -106,92 +301,386 @@ class Listing(db.Model):
     price = db.Column(db.Float, nullable=True)
     quantity = db.Column(db.String(80), nullable=True)  # e.g., "50 liters/week"
     location = db.Column(db.String(200))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-    owner = db.relationship("User", backref="listings")
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=utcnow(), nullable=False)
+    # Leading slice of description, filled by list views via with_expression()
+    excerpt = db.query_expression()
+
+    owner = db.relationship("User", back_populates="listings", lazy="joined")
+
+
+# Full-text index over listings (SQLite FTS5, external content). Created and
+# dropped together with the listings table; triggers keep it in sync so every
+# write path (ORM, bulk inserts, raw SQL) is covered.
+LISTINGS_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts USING fts5(
+        title, description, category UNINDEXED,
+        content='listings', content_rowid='id',
+        tokenize='porter unicode61', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS listings_fts_ai AFTER INSERT ON listings BEGIN
+        INSERT INTO listings_fts(rowid, title, description, category)
+        VALUES (new.id, new.title, new.description, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS listings_fts_ad AFTER DELETE ON listings BEGIN
+        INSERT INTO listings_fts(listings_fts, rowid, title, description, category)
+        VALUES ('delete', old.id, old.title, old.description, old.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS listings_fts_au AFTER UPDATE ON listings BEGIN
+        INSERT INTO listings_fts(listings_fts, rowid, title, description, category)
+        VALUES ('delete', old.id, old.title, old.description, old.category);
+        INSERT INTO listings_fts(rowid, title, description, category)
+        VALUES (new.id, new.title, new.description, new.category);
+    END""",
+]
+
+
+def _sqlite_has_fts5(ddl, target, bind, **kw):
+    return any(row[0] == "ENABLE_FTS5" for row in bind.exec_driver_sql("PRAGMA compile_options"))
+
+
+def build_listings_fts(force=False):
+    """Create the listings_fts index and triggers on an existing database and
+    index every listing from the listings table. Safe to run repeatedly; no
+    listing data is touched. Unless ``force`` is set, an existing index is left
+    as is. Returns False when FTS5 is unavailable."""
+    with db.engine.begin() as conn:
+        if conn.dialect.name != "sqlite" or not _sqlite_has_fts5(None, None, conn):
+            return False
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'listings_fts'"
+        ).first()
+        if exists and not force:
+            return True
+        for stmt in LISTINGS_FTS_DDL:
+            conn.exec_driver_sql(stmt)
+        conn.exec_driver_sql("INSERT INTO listings_fts(listings_fts) VALUES ('rebuild')")
+    reset_listings_fts_available()
+    return True
+
+
+for _stmt in LISTINGS_FTS_DDL:
+    event.listen(Listing.__table__, "after_create",
+                 DDL(_stmt).execute_if(dialect="sqlite", callable_=_sqlite_has_fts5))
+event.listen(Listing.__table__, "before_drop",
+             DDL("DROP TABLE IF EXISTS listings_fts").execute_if(dialect="sqlite"))
+
+# Case-insensitive prefix indexes backing the LIKE-free fallback search
+db.Index("ix_listing_title_nocase", func.lower(Listing.title))
+db.Index("ix_listing_description_nocase", func.lower(Listing.description))
 
 
 class Message(db.Model):
     __tablename__ = "messages"
+    __table_args__ = (
+        db.Index("ix_msg_receiver_created", "receiver_id", "created_at"),
+        db.Index("ix_msg_sender_created", "sender_id", "created_at"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey("users.id"))
     receiver_id = db.Column(db.Integer, db.ForeignKey("users.id"))
     subject = db.Column(db.String(200))
     body = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=utcnow(), nullable=False)
 
-    sender = db.relationship("User", foreign_keys=[sender_id], backref="sent_messages")
-    receiver = db.relationship("User", foreign_keys=[receiver_id], backref="received_messages")
+    sender = db.relationship("User", foreign_keys=[sender_id], back_populates="sent_messages", lazy="joined")
+    receiver = db.relationship("User", foreign_keys=[receiver_id], back_populates="received_messages", lazy="joined")
 
 
 class Event(db.Model):
     __tablename__ = "events"
+    __table_args__ = (
+        db.Index("ix_event_date", "date"),
+        db.Index("ix_event_organizer", "organizer_id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200))
     description = db.Column(db.Text)
     date = db.Column(db.DateTime)
     organizer_id = db.Column(db.Integer, db.ForeignKey("users.id"))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=utcnow(), nullable=False)
 
-    organizer = db.relationship("User", backref="organized_events")
+    organizer = db.relationship("User", back_populates="organized_events", lazy="joined")
 
 
 # --- Forms ---
-class RegisterForm(FlaskForm):
+# Choices are built once at import and shared by every form instance
+ROLE_CHOICES = tuple((r.value, r.value.title()) for r in RoleEnum)
+LISTING_CATEGORY_CHOICES = (
+    ("milk", "Milk/Product"), ("transport", "Transport"), ("vet", "Vet Service"),
+    ("research", "Research/Collab"), ("other", "Other")
+)
+
+
+def session_csrf_token():
+    """The session's CSRF token, created on first use and reused for its lifetime."""
+    token = session.get("csrf")
+    if token is None:
+        token = session["csrf"] = secrets.token_urlsafe(32)
+    return token
+
+
+class SessionCSRF(CSRF):
+    """CSRF check against the per-session token: a dict lookup plus a
+    constant-time compare, instead of Flask-WTF's per-render HMAC signing."""
+
+    def generate_csrf_token(self, csrf_token_field):
+        return session_csrf_token()
+
+    def validate_csrf_token(self, form, field):
+        expected = session.get("csrf")
+        if not expected or not field.data or not hmac.compare_digest(str(field.data), expected):
+            raise ValidationError("The CSRF token is missing or invalid.")
+
+
+class BaseForm(FlaskForm):
+    class Meta:
+        csrf_class = SessionCSRF
+
+
+class RegisterForm(BaseForm):
     username = StringField("Username", validators=[InputRequired(), Length(3, 80)])
     email = StringField("Email", validators=[InputRequired(), Email()])
     password = PasswordField("Password", validators=[InputRequired(), Length(6, 128)])
-    role = SelectField("Role", choices=[(r.value, r.value.title()) for r in RoleEnum])
+    role = SelectField("Role", choices=ROLE_CHOICES)
 
 
-class LoginForm(FlaskForm):
+class LoginForm(BaseForm):
     username = StringField("Username", validators=[InputRequired()])
     password = PasswordField("Password", validators=[InputRequired()])
 
 
-class ListingForm(FlaskForm):
+class ListingForm(BaseForm):
     title = StringField("Title", validators=[InputRequired(), Length(2, 200)])
     description = TextAreaField("Description", validators=[InputRequired(), Length(10, 2000)])
-    category = SelectField("Category", choices=[
-        ("milk", "Milk/Product"), ("transport", "Transport"), ("vet", "Vet Service"),
-        ("research", "Research/Collab"), ("other", "Other")
-    ])
+    category = SelectField("Category", choices=LISTING_CATEGORY_CHOICES)
     price = FloatField("Price (optional)")
     quantity = StringField("Quantity (optional)")
     location = StringField("Location (optional)")
 
 
-class MessageForm(FlaskForm):
+class MessageForm(BaseForm):
     receiver = StringField("To (username)", validators=[InputRequired()])
     subject = StringField("Subject", validators=[InputRequired(), Length(1, 200)])
     body = TextAreaField("Message", validators=[InputRequired(), Length(1, 2000)])
 
 
-class EventForm(FlaskForm):
+class EventForm(BaseForm):
     title = StringField("Title", validators=[InputRequired(), Length(2, 200)])
     description = TextAreaField("Description", validators=[InputRequired(), Length(10, 2000)])
     date = StringField("Date (YYYY-MM-DD)", validators=[InputRequired()])
 
 
+# --- Search ---
+def _fts_query(q):
+    """Turn free text into an FTS5 query: every word quoted and prefix-matched."""
+    terms = ['"%s"*' % t.replace('"', '""') for t in q.split()]
+    return " ".join(terms)
+
+
+# engine -> whether listings_fts exists; the schema does not change while the
+# app runs, so this is looked up once and reset whenever the listings table or
+# its index is (re)built in this process. Restart the server after running
+# `flask build-search-index` against a live database.
+_listings_fts_available = {}
+
+
+def reset_listings_fts_available(*args, **kwargs):
+    _listings_fts_available.clear()
+
+
+event.listen(Listing.__table__, "after_create", reset_listings_fts_available)
+event.listen(Listing.__table__, "after_drop", reset_listings_fts_available)
+
+
+def listings_fts_available():
+    """True when the listings_fts index exists (FTS5 built in, schema up to date)."""
+    engine = db.engine
+    if engine not in _listings_fts_available:
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'listings_fts'"
+        _listings_fts_available[engine] = db.session.execute(text(sql)).first() is not None
+    return _listings_fts_available[engine]
+
+
+# SQLite's lower() only folds ASCII, so queries are folded the same way
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _prefix_upper_bound(prefix):
+    """Exclusive upper bound for a range scan over strings starting with ``prefix``.
+
+    SQLite's BINARY collation compares UTF-8 bytes, which order the same way
+    as code points, so bumping the last code point gives a tight bound
+    (``prefix + "\\uffff"`` would miss characters above U+FFFF). Surrogates
+    are skipped since they cannot be encoded; returns None when the prefix is
+    all U+10FFFF and so has no upper bound.
+    """
+    while prefix:
+        last = ord(prefix[-1])
+        if last < sys.maxunicode:
+            nxt = 0xE000 if last == 0xD7FF else last + 1
+            return prefix[:-1] + chr(nxt)
+        prefix = prefix[:-1]
+    return None
+
+
+def _prefix_search_ids(q, category="", limit=200):
+    """Fallback search: title or description starting with ``q``, newest first.
+
+    Only used when FTS5 is unavailable. Each branch of the UNION is a range scan
+    on a lower(...) expression index, rather than a LIKE '%q%' table scan.
+    Like SQLite's lower(), matching is case-insensitive for ASCII letters only;
+    non-ASCII characters must match case exactly.
+    """
+    prefix = q.strip().translate(_ASCII_LOWER)
+    if not prefix:
+        return []
+    upper = _prefix_upper_bound(prefix)
+    branches = []
+    for column in (Listing.title, Listing.description):
+        key = func.lower(column)
+        branch = select(Listing.id, Listing.created_at).where(key >= prefix)
+        if upper is not None:
+            branch = branch.where(key < upper)
+        if category:
+            branch = branch.where(Listing.category == category)
+        branches.append(branch)
+    matches = union(*branches).subquery()
+    stmt = select(matches.c.id).order_by(matches.c.created_at.desc(), matches.c.id.desc()).limit(limit)
+    return list(db.session.execute(stmt).scalars())
+
+
+def search_listing_ids(q, category="", limit=200):
+    """Ids of listings matching ``q``, best BM25 match first.
+
+    Falls back to a prefix search when the FTS5 index is unavailable.
+    """
+    if not listings_fts_available():
+        return _prefix_search_ids(q, category, limit)
+    match = _fts_query(q)
+    if not match:
+        return []
+    w_title, w_desc = app.config["SEARCH_BM25_WEIGHTS"]
+    sql = "SELECT rowid FROM listings_fts WHERE listings_fts MATCH :q"
+    if category:
+        sql += " AND category = :cat"
+    sql += f" ORDER BY bm25(listings_fts, {float(w_title)}, {float(w_desc)}) LIMIT :limit"
+    return [row[0] for row in db.session.execute(text(sql), {"q": match, "cat": category, "limit": limit})]
+
+
+def search_listings(q, category="", limit=200, options=()):
+    """Full-text search over listings, best BM25 match first.
+
+    ``options`` are loader options applied when hydrating the matched rows.
+    """
+    ids = search_listing_ids(q, category, limit)
+    if not ids:
+        return []
+    by_id = {l.id: l for l in Listing.query.options(*options).filter(Listing.id.in_(ids))}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def _raise_on_unplanned_loads(orm_execute_state):
+    """Under debug/testing, add raiseload("*") to every ORM SELECT in the app.
+
+    Any relationship a route does not load explicitly (joinedload, selectin,
+    ...) then raises on access instead of silently issuing one query per row,
+    so templates and routes must declare what they use. Lazy loads themselves
+    and column refreshes are left alone. In production this is a no-op.
+    """
+    if not (app.debug or app.testing):
+        return
+    state = orm_execute_state
+    if state.is_select and not state.is_column_load and not state.is_relationship_load:
+        state.statement = state.statement.options(raiseload("*"))
+
+
+# --- Response caching ---
+LISTINGS_CACHE_TIMEOUT = 60
+
+
+def listings_cache_key(*args, **kwargs):
+    """Cache key for listing pages: path, sorted query string and listings generation."""
+    gen = cache.get("listings_gen") or 0
+    query = urlencode(sorted(request.args.items(multi=True)))
+    return f"listings:{gen}:{request.path}?{query}"
+
+
+def invalidate_listings_cache():
+    """Bump the listings generation so every cached listing page (including the
+    events block on ``/``) misses.
+
+    The counter is stored without expiry: if it lapsed back to 0, later bumps
+    would revive pages cached under the old generation numbers.
+    """
+    cache.set("listings_gen", (cache.get("listings_gen") or 0) + 1, timeout=0)
+
+
+def is_personalized_page():
+    """True when the rendered page depends on who is asking (login state, flashes)."""
+    return current_user.is_authenticated or "_flashes" in session
+
+
+@app.context_processor
+def inject_csrf_token():
+    # passed as a callable so pages without forms never touch the session
+    return {"csrf_token": session_csrf_token}
+
+
+LISTING_EXCERPT_CHARS = 250
+
+
+def listing_summary_options():
+    """Loader options for listing cards: summary columns, a description excerpt
+    and the owner's name, without the full description TEXT or owner profile."""
+    return [
+        load_only(Listing.id, Listing.title, Listing.category, Listing.price, Listing.quantity,
+                  Listing.location, Listing.created_at, Listing.owner_id),
+        # one char past the cut so templates can tell whether to add "..."
+        with_expression(Listing.excerpt, func.substr(Listing.description, 1, LISTING_EXCERPT_CHARS + 1)),
+        joinedload(Listing.owner).options(load_only(User.id, User.username), lazyload(User.profile)),
+    ]
+
+
 # --- Login loader ---
+USER_CACHE_TIMEOUT = 600
+# Columns needed to rebuild current_user without a SELECT; anything else
+# (password_hash, relationships) is loaded on first access as usual.
+USER_CACHE_COLUMNS = ("id", "username", "email", "role", "created_at")
+
+
+def forget_cached_user(user_id):
+    cache.delete(f"user:{user_id}")
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    key = f"user:{int(user_id)}"
+    data = cache.get(key)
+    if data is not None:
+        u = User(**data)
+        make_transient_to_detached(u)
+        return db.session.merge(u, load=False)
+    u = db.session.get(User, int(user_id))
+    if u is not None:
+        cache.set(key, {c: getattr(u, c) for c in USER_CACHE_COLUMNS}, timeout=USER_CACHE_TIMEOUT)
+    return u
 
 
 # --- Routes ---
 @app.route("/")
+@cache.cached(timeout=LISTINGS_CACHE_TIMEOUT, make_cache_key=listings_cache_key, unless=is_personalized_page)
 def index():
     # show recent listings and events and quick filters
     q = request.args.get("q", "")
     cat = request.args.get("cat", "")
-    listings = Listing.query
     if q:
-        listings = listings.filter(Listing.title.contains(q) | Listing.description.contains(q))
-    if cat:
-        listings = listings.filter_by(category=cat)
-    listings = listings.order_by(Listing.created_at.desc()).limit(30).all()
-    events = Event.query.order_by(Event.date.asc()).limit(10).all()
+        listings = search_listings(q, cat, limit=30, options=listing_summary_options())
+    else:
+        listings = Listing.query.options(*listing_summary_options())
+        if cat:
+            listings = listings.filter_by(category=cat)
+        listings = listings.order_by(Listing.created_at.desc(), Listing.id.desc()).limit(30).all()
+    events = Event.query.options(joinedload(Event.organizer)).order_by(Event.date.asc()).limit(10).all()
     return render_template("index.html", listings=listings, events=events, query=q, cat=cat)
 
 
@@ -202,13 +691,11 @@ def register():
         if User.query.filter((User.username == form.username.data) | (User.email == form.email.data)).first():
             flash("Username or email already exists", "danger")
             return redirect(url_for("register"))
-        u = User(username=form.username.data, email=form.email.data, role=form.role.data)
+        u = User(username=form.username.data, email=form.email.data, role=RoleEnum(form.role.data))
         u.set_password(form.password.data)
-        db.session.add(u)
-        db.session.commit()
-        # create empty profile
-        prof = Profile(user_id=u.id, full_name="", phone="", location="", bio="")
-        db.session.add(prof)
+        # create empty profile; the relationship resolves user_id at flush time
+        prof = Profile(user=u, full_name="", phone="", location="", bio="")
+        db.session.add_all([u, prof])
         db.session.commit()
         flash("Account created. Please log in.", "success")
         return redirect(url_for("login"))
@@ -216,12 +703,14 @@ def register():
 
 
 @app.route("/login", methods=["GET", "POST"])
+@limiter.limit(lambda: app.config["LOGIN_RATE_LIMIT"], methods=["POST"])
 def login():
     form = LoginForm()
     if form.validate_on_submit():
         u = User.query.filter_by(username=form.username.data).first()
         if u and u.check_password(form.password.data):
             login_user(u)
+            forget_cached_user(u.id)
             flash("Logged in.", "success")
             return redirect(url_for("dashboard"))
         flash("Invalid username or password.", "danger")
@@ -239,10 +728,24 @@ def logout():
 @app.route("/dashboard")
 @login_required
 def dashboard():
-    # show user's listings, messages, events relevant to role
-    my_listings = Listing.query.filter_by(owner_id=current_user.id).all()
-    inbox = Message.query.filter_by(receiver_id=current_user.id).order_by(Message.created_at.desc()).limit(20).all()
-    organized = Event.query.filter_by(organizer_id=current_user.id).all()
+    # show user's listings, messages, events relevant to role.
+    # Owner/organizer/receiver are current_user, so their default joined loads
+    # are switched off; each query is a single statement on one connection.
+    my_listings = db.session.scalars(
+        select(Listing).options(lazyload(Listing.owner))
+        .where(Listing.owner_id == current_user.id).order_by(Listing.created_at.desc(), Listing.id.desc())
+    ).all()
+    inbox = db.session.scalars(
+        select(Message).options(
+            joinedload(Message.sender).options(load_only(User.id, User.username), lazyload(User.profile)),
+            lazyload(Message.receiver))
+        .where(Message.receiver_id == current_user.id)
+        .order_by(Message.created_at.desc(), Message.id.desc()).limit(20)
+    ).all()
+    organized = db.session.scalars(
+        select(Event).options(lazyload(Event.organizer))
+        .where(Event.organizer_id == current_user.id)
+    ).all()
     return render_template("dashboard.html", my_listings=my_listings, inbox=inbox, organized=organized)
 
 
@@ -262,6 +765,7 @@ def new_listing():
         )
         db.session.add(l)
         db.session.commit()
+        invalidate_listings_cache()
         flash("Listing created.", "success")
         return redirect(url_for("dashboard"))
     return render_template("new_listing.html", form=form)
@@ -269,14 +773,39 @@ def new_listing():
 
 @app.route("/listing/<int:listing_id>")
 def view_listing(listing_id):
-    l = Listing.query.get_or_404(listing_id)
+    l = Listing.query.options(joinedload(Listing.owner)).get_or_404(listing_id)
     return render_template("listing.html", l=l)
 
 
 @app.route("/user/<username>")
 def view_user(username):
-    u = User.query.filter_by(username=username).first_or_404()
-    return render_template("user.html", u=u)
+    u = User.query.options(joinedload(User.profile)).filter_by(username=username).first_or_404()
+    # User.listings is lazy="raise"; fetch the user's listings explicitly
+    listings = (
+        Listing.query.options(lazyload(Listing.owner), load_only(Listing.id, Listing.title, Listing.category))
+        .filter_by(owner_id=u.id)
+        .order_by(Listing.created_at.desc(), Listing.id.desc()).all()
+    )
+    return render_template("user.html", u=u, listings=listings)
+
+
+@app.route("/uploads/<path:name>")
+def uploaded_file(name):
+    accel_prefix = app.config["UPLOADS_ACCEL_PREFIX"]
+    if accel_prefix:
+        path = safe_join(app.config['UPLOAD_FOLDER'], name)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        # nginx serves the file itself (sendfile); we only check it exists and point to it.
+        # The header is parsed as a URI, so the name must be percent-encoded.
+        resp = app.response_class(mimetype=mimetypes.guess_type(name)[0] or "application/octet-stream")
+        resp.headers["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + quote(name)
+    else:
+        resp = send_from_directory(app.config['UPLOAD_FOLDER'], name)
+    resp.cache_control.no_cache = None
+    resp.cache_control.public = True
+    resp.cache_control.max_age = app.config["UPLOADS_MAX_AGE"]
+    return resp
 
 
 @app.route("/message/new", methods=["GET", "POST"])
@@ -319,44 +848,199 @@ def new_event():
         )
         db.session.add(ev)
         db.session.commit()
+        invalidate_listings_cache()
         flash("Event created.", "success")
         return redirect(url_for("dashboard"))
     return render_template("new_event.html", form=form)
 
 
 # --- Simple API endpoints (JSON) for external integrations (mobile app, aggregator) ---
+API_PAGE_SIZE = 50
+
+
+# Response shapes for the JSON API. msgspec compiles a dedicated encoder per
+# struct. Fields are declared in alphabetical order so the output matches the
+# sorted-key JSON the API has always returned; ListingDetailOut is the one
+# exception, appending ``description`` after the inherited ListingOut fields.
+class OwnerOut(msgspec.Struct):
+    id: int | None
+    username: str | None
+
+
+class ListingOut(msgspec.Struct):
+    category: str | None
+    id: int
+    location: str | None
+    owner: OwnerOut
+    price: float | None
+    quantity: str | None
+    title: str
+
+
+class ListingDetailOut(ListingOut):
+    description: str | None
+
+
+class ProfileOut(msgspec.Struct):
+    bio: str | None = ""
+    full_name: str | None = ""
+    location: str | None = ""
+    phone: str | None = ""
+
+
+class UserOut(msgspec.Struct):
+    email: str
+    id: int
+    profile: ProfileOut
+    role: RoleEnum
+    username: str
+
+
+json_encoder = msgspec.json.Encoder()
+
+
+def msgspec_response(obj):
+    return app.response_class(json_encoder.encode(obj), mimetype="application/json")
+
+
+def encode_listing_cursor(created_at, listing_id):
+    return f"{created_at.isoformat()}_{listing_id}"
+
+
+MAX_SQLITE_INTEGER = 2 ** 63 - 1
+
+
+def decode_listing_cursor(cursor):
+    """Parse a cursor from encode_listing_cursor; a bare ISO timestamp is accepted too.
+
+    Timestamps with an offset are converted to naive UTC, matching stored values.
+    """
+    ts, _, listing_id = cursor.partition("_")
+    try:
+        ts = datetime.fromisoformat(ts)
+        listing_id = int(listing_id) if listing_id else None
+    except ValueError:
+        abort(400, "invalid cursor")
+    if listing_id is not None and not 0 <= listing_id <= MAX_SQLITE_INTEGER:
+        abort(400, "invalid cursor")
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts, listing_id
+
+
+def listing_summary_select(*extra_columns):
+    """Core select of listing summary columns plus owner, without ``description``."""
+    return select(
+        Listing.id, Listing.title, Listing.category,
+        Listing.price, Listing.quantity, Listing.location, Listing.created_at,
+        User.id.label("owner_id"), User.username.label("owner_username"), *extra_columns
+    ).outerjoin(User, User.id == Listing.owner_id)
+
+
 @app.route("/api/listings")
+@cache.cached(timeout=LISTINGS_CACHE_TIMEOUT, make_cache_key=listings_cache_key)
 def api_listings():
-    """Return simple JSON list of listings with filters q and category."""
+    """Return JSON list of listings with filters q and category.
+
+    Without ``q`` results are newest first and paginated by keyset: pass the
+    ``X-Next-Cursor`` response header back as ``?cursor=`` for the next page.
+    With ``q`` the best BM25 matches are returned in rank order, unpaginated.
+    Descriptions are omitted; fetch /api/listings/<id> for the full record.
+    """
     q = request.args.get("q", "")
     cat = request.args.get("category", "")
-    qry = Listing.query
+    cursor = request.args.get("cursor", "")
+    # Plain column rows: no ORM instances, identity map or lazy loads involved
+    stmt = listing_summary_select()
     if q:
-        qry = qry.filter(Listing.title.contains(q) | Listing.description.contains(q))
-    if cat:
-        qry = qry.filter_by(category=cat)
-    results = []
-    for l in qry.order_by(Listing.created_at.desc()).limit(200).all():
-        results.append({
-            "id": l.id, "title": l.title, "description": l.description,
-            "category": l.category, "price": l.price, "quantity": l.quantity,
-            "location": l.location, "owner": {"id": l.owner.id, "username": l.owner.username}
-        })
-    return jsonify(results)
+        ids = search_listing_ids(q, cat, limit=API_PAGE_SIZE)
+        by_id = {r.id: r for r in db.session.execute(stmt.where(Listing.id.in_(ids)))}
+        rows = [by_id[i] for i in ids if i in by_id]
+    else:
+        if cat:
+            stmt = stmt.where(Listing.category == cat)
+        if cursor:
+            ts, listing_id = decode_listing_cursor(cursor)
+            if listing_id is None:
+                stmt = stmt.where(Listing.created_at < ts)
+            else:
+                stmt = stmt.where(tuple_(Listing.created_at, Listing.id) < (ts, listing_id))
+        stmt = stmt.order_by(Listing.created_at.desc(), Listing.id.desc()).limit(API_PAGE_SIZE)
+        rows = db.session.execute(stmt).all()
+    results = [ListingOut(
+        id=r.id, title=r.title,
+        category=r.category, price=r.price, quantity=r.quantity,
+        location=r.location, owner=OwnerOut(id=r.owner_id, username=r.owner_username)
+    ) for r in rows]
+    resp = msgspec_response(results)
+    if not q and len(rows) == API_PAGE_SIZE:
+        resp.headers["X-Next-Cursor"] = encode_listing_cursor(rows[-1].created_at, rows[-1].id)
+    return resp
+
+
+@app.route("/api/listings/<int:listing_id>")
+@cache.cached(timeout=LISTINGS_CACHE_TIMEOUT, make_cache_key=listings_cache_key)
+def api_listing(listing_id):
+    """Return one listing including its full description."""
+    r = db.session.execute(listing_summary_select(Listing.description).where(Listing.id == listing_id)).first()
+    if r is None:
+        abort(404)
+    return msgspec_response(ListingDetailOut(
+        id=r.id, title=r.title, description=r.description,
+        category=r.category, price=r.price, quantity=r.quantity,
+        location=r.location, owner=OwnerOut(id=r.owner_id, username=r.owner_username)
+    ))
+
+
+USER_PAYLOAD_CACHE_TIMEOUT = 3600
+
+
+@cache.memoize(timeout=USER_PAYLOAD_CACHE_TIMEOUT)
+def user_payload(user_id):
+    """Encoded /api/users/<id> body; invalidated by the User/Profile write hooks below."""
+    u = User.query.options(joinedload(User.profile)).get_or_404(user_id)
+    p = u.profile
+    profile = ProfileOut(full_name=p.full_name, phone=p.phone, location=p.location, bio=p.bio) if p else ProfileOut()
+    return json_encoder.encode(UserOut(id=u.id, username=u.username, email=u.email, role=u.role, profile=profile))
+
+
+# Writes to User/Profile only record the affected user ids during flush; the
+# cached entries are dropped once the transaction commits. Clearing at flush
+# time would let a concurrent request re-cache the old row before the commit.
+def _mark_user_stale(target, user_id):
+    session = object_session(target)
+    if session is not None and user_id is not None:
+        session.info.setdefault("stale_user_ids", set()).add(user_id)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_written(mapper, connection, target):
+    _mark_user_stale(target, target.id)
+
+
+@event.listens_for(Profile, "after_insert")
+@event.listens_for(Profile, "after_update")
+@event.listens_for(Profile, "after_delete")
+def _profile_written(mapper, connection, target):
+    _mark_user_stale(target, target.user_id)
+
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_stale_users(session):
+    for user_id in session.info.pop("stale_user_ids", ()):
+        cache.delete_memoized(user_payload, user_id)
+        forget_cached_user(user_id)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard_stale_users(session):
+    session.info.pop("stale_user_ids", None)
 
 
 @app.route("/api/users/<int:user_id>")
 def api_user(user_id):
-    u = User.query.get_or_404(user_id)
-    return jsonify({
-        "id": u.id, "username": u.username, "email": u.email, "role": u.role,
-        "profile": {
-            "full_name": u.profile.full_name if u.profile else "",
-            "phone": u.profile.phone if u.profile else "",
-            "location": u.profile.location if u.profile else "",
-            "bio": u.profile.bio if u.profile else ""
-        }
-    })
+    return app.response_class(user_payload(user_id), mimetype="application/json")
 
 
 # --- Small utilities & seed loader ---
@@ -366,51 +1050,59 @@ def initdb_command():
     db.drop_all()
     db.create_all()
     seed_data()
+    invalidate_listings_cache()
     print("Initialized the database and added seed data.")
 
 
+@app.cli.command("build-search-index")
+def build_search_index_command():
+    """Create or rebuild the listings full-text index without touching data."""
+    if build_listings_fts(force=True):
+        print("Rebuilt the listings search index.")
+    else:
+        print("SQLite FTS5 is not available; search uses the prefix fallback.")
+
+
 def seed_data():
+    """Insert demo users, profiles, listings, an event and a message in one transaction."""
     # Create sample users for each role
     sample_users = [
-        ("farmer1", "farmer1@example.com", "farmerpass", RoleEnum.FARMER.value),
-        ("producer1", "producer1@example.com", "producerpass", RoleEnum.PRODUCER.value),
-        ("consumer1", "consumer1@example.com", "consumerpass", RoleEnum.CONSUMER.value),
-        ("research1", "research1@example.com", "researchpass", RoleEnum.RESEARCHER.value),
-        ("vet1", "vet1@example.com", "vetpass", RoleEnum.VET.value),
-        ("trans1", "trans1@example.com", "transpass", RoleEnum.TRANSPORTER.value),
-        ("ent1", "ent1@example.com", "entpass", RoleEnum.ENTREPRENEUR.value),
-        ("gov1", "gov1@example.com", "govpass", RoleEnum.GOV.value),
+        ("farmer1", "farmer1@example.com", "farmerpass", RoleEnum.FARMER),
+        ("producer1", "producer1@example.com", "producerpass", RoleEnum.PRODUCER),
+        ("consumer1", "consumer1@example.com", "consumerpass", RoleEnum.CONSUMER),
+        ("research1", "research1@example.com", "researchpass", RoleEnum.RESEARCHER),
+        ("vet1", "vet1@example.com", "vetpass", RoleEnum.VET),
+        ("trans1", "trans1@example.com", "transpass", RoleEnum.TRANSPORTER),
+        ("ent1", "ent1@example.com", "entpass", RoleEnum.ENTREPRENEUR),
+        ("gov1", "gov1@example.com", "govpass", RoleEnum.GOV),
     ]
     users = []
     for u, e, p, r in sample_users:
         user = User(username=u, email=e, role=r)
         user.set_password(p)
-        db.session.add(user)
         users.append(user)
-    db.session.commit()
+    # return_defaults fetches the new primary keys needed by the rows below
+    db.session.bulk_save_objects(users, return_defaults=True)
 
     # profiles
-    for u in users:
-        prof = Profile(user_id=u.id, full_name=u.username.title(), phone="N/A", location="Rajasthan", bio=f"Role: {u.role}")
-        db.session.add(prof)
-    db.session.commit()
+    profiles = [
+        Profile(user_id=u.id, full_name=u.username.title(), phone="N/A", location="Rajasthan", bio=f"Role: {u.role}")
+        for u in users
+    ]
 
     # sample listings
     l1 = Listing(title="Raw camel milk - weekly supply (50 L)", description="High-quality raw camel milk from free-range camels. Good for research and consumers.", owner_id=users[0].id, category="milk", price=1.5, quantity="50 L/week", location="Bikaner, Rajasthan")
     l2 = Listing(title="Pasteurized camel milk - 10L packs", description="Hygienically pasteurized and packaged. Certified for sale.", owner_id=users[1].id, category="milk", price=2.0, quantity="10 L packs", location="Jaisalmer")
     l3 = Listing(title="Transport service for milk (cold chain)", description="Refrigerated transport available across districts.", owner_id=users[5].id, category="transport", price=0.5, quantity="per km", location="Rajasthan statewide")
     l4 = Listing(title="Veterinary health check & vaccination", description="Experienced camel vet offering herd health checkups.", owner_id=users[4].id, category="vet", price=20.0, quantity="per visit", location="Rajasthan")
-    db.session.add_all([l1, l2, l3, l4])
-    db.session.commit()
 
     # events
     ev = Event(title="Camel Conservation Workshop", description="Field workshop on camel nutrition and conservation.", date=datetime.utcnow(), organizer_id=users[7].id)
-    db.session.add(ev)
-    db.session.commit()
 
     # messages
     msg = Message(sender_id=users[2].id, receiver_id=users[0].id, subject="Interested in weekly milk", body="Hi, I'd like to buy 20L/week. Can we discuss?")
-    db.session.add(msg)
+
+    db.session.bulk_save_objects(profiles + [l1, l2, l3, l4, ev, msg])
     db.session.commit()
 
 
@@ -424,8 +1116,12 @@ def handle_500(e):
 
 # --- Run ---
 if __name__ == "__main__":
-    if not os.path.exists(DB_PATH):
-        db.create_all()
-        seed_data()
-        print("Database created and seeded.")
+    with app.app_context():
+        if not os.path.exists(DB_PATH):
+            db.create_all()
+            seed_data()
+            print("Database created and seeded.")
+        else:
+            # databases created before full-text search get their index here
+            build_listings_fts()
     app.run(debug=True)